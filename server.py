@@ -3,14 +3,21 @@ Think & Show MCP Server
 AI 응답을 시각화하는 MCP 서버
 """
 
-import json
-import urllib.parse
+import asyncio
 import os
 import base64
+import itertools
+import json
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import Optional, Literal
+from urllib.parse import quote
 
 import httpx
+import orjson
 from mcp.server.fastmcp import FastMCP
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 
 class Config:
@@ -19,6 +26,13 @@ class Config:
     QUICKCHART_URL = os.environ.get("QUICKCHART_URL", "https://quickchart.io/chart")
     QUICKCHART_MAX_URL_LENGTH = int(os.environ.get("QUICKCHART_MAX_URL_LENGTH", "8000"))
     HTTP_TIMEOUT = int(os.environ.get("HTTP_TIMEOUT", "10"))
+    HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY = int(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+    PROBE_CACHE_TTL = int(os.environ.get("PROBE_CACHE_TTL", "300"))
+    PROBE_CACHE_SIZE = int(os.environ.get("PROBE_CACHE_SIZE", "1024"))
+    PROBE_RETRY_ATTEMPTS = int(os.environ.get("PROBE_RETRY_ATTEMPTS", "2"))
+    CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", "256"))
     DEFAULT_CHART_WIDTH = int(os.environ.get("DEFAULT_CHART_WIDTH", "500"))
     DEFAULT_CHART_HEIGHT = int(os.environ.get("DEFAULT_CHART_HEIGHT", "300"))
 
@@ -29,6 +43,26 @@ CHART_THEMES = {
     "kakao": {"background": "#fee500", "font": "#191919", "grid": "rgba(0, 0, 0, 0.1)"}
 }
 
+# Theme background colors, already percent-encoded for the QuickChart bkg parameter
+QUOTED_BACKGROUNDS = {t["background"]: quote(t["background"], safe="") for t in CHART_THEMES.values()}
+
+# Chart types drawn without x/y axes
+NO_SCALE_CHART_TYPES = frozenset({"pie", "doughnut", "radar"})
+
+# Chart.js options per (theme, has_scales); shared read-only, copied only when a title is added
+CHART_OPTIONS = {
+    (name, has_scales): {
+        "responsive": False,
+        "plugins": {"legend": {"labels": {"color": t["font"]}}},
+        "scales": {
+            "x": {"ticks": {"color": t["font"]}, "grid": {"color": t["grid"]}},
+            "y": {"ticks": {"color": t["font"]}, "grid": {"color": t["grid"]}}
+        } if has_scales else {}
+    }
+    for name, t in CHART_THEMES.items()
+    for has_scales in (True, False)
+}
+
 COLOR_PALETTES = {
     "default": [
         "rgba(54, 162, 235, 0.7)", "rgba(255, 99, 132, 0.7)",
@@ -47,6 +81,17 @@ COLOR_PALETTES = {
     ]
 }
 
+MERMAID_THEME_HEADERS = {
+    theme: f"%%{{init: {{'theme': '{theme}'}}}}%%"
+    for theme in ("default", "dark", "forest", "neutral")
+}
+
+# Opaque variants of COLOR_PALETTES used as default border colors
+BORDER_PALETTES = {
+    name: [c.replace("0.7", "1").replace("0.8", "1") for c in palette]
+    for name, palette in COLOR_PALETTES.items()
+}
+
 TABLE_STYLES = {
     "default": {"header_bg": "#4CAF50", "header_color": "white", "highlight_bg": "#E3F2FD", "border": "#ddd"},
     "dark": {"header_bg": "#333333", "header_color": "white", "highlight_bg": "#444444", "border": "#555555"},
@@ -54,24 +99,114 @@ TABLE_STYLES = {
 }
 
 
+# Fallbacks for unknown names, resolved once instead of on every lookup
+_DEFAULT_PALETTE = COLOR_PALETTES["default"]
+_DEFAULT_BORDER_PALETTE = BORDER_PALETTES["default"]
+_DEFAULT_CHART_THEME = CHART_THEMES["light"]
+_DEFAULT_TABLE_STYLE = TABLE_STYLES["default"]
+
+
 # Initialize MCP Server
 mcp = FastMCP("Think & Show")
 
+# Shared HTTP client so outbound requests reuse pooled keep-alive connections
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=Config.HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=True,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def cache_put(cache: dict, key, value, max_size: int) -> None:
+    # Dicts keep insertion order, so the first key is the oldest entry
+    cache.pop(key, None)
+    if len(cache) >= max_size:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+
+@retry(
+    stop=stop_after_attempt(Config.PROBE_RETRY_ATTEMPTS),
+    wait=wait_exponential(multiplier=0.1, max=0.5),
+    retry=retry_if_exception_type(httpx.TransportError),
+    reraise=True,
+)
+async def _head_ok(url: str) -> bool:
+    response = await get_http_client().head(url)
+    return response.status_code == 200
 
+
+# url -> (accessible, checked_at)
+_probe_cache: dict[str, tuple[bool, float]] = {}
+
+
+async def _probe_url(url: str) -> bool:
+    cached = _probe_cache.get(url)
+    if cached is not None and time.monotonic() - cached[1] < Config.PROBE_CACHE_TTL:
+        return cached[0]
+
+    try:
+        accessible = await _head_ok(url)
+    except Exception:
+        # Transient failures are not cached so the next call probes again
+        return False
+
+    cache_put(_probe_cache, url, (accessible, time.monotonic()), Config.PROBE_CACHE_SIZE)
+    return accessible
+
+
+@lru_cache(maxsize=512)
 def encode_mermaid(diagram: str) -> str:
-    return base64.urlsafe_b64encode(diagram.encode()).decode()
+    # str.encode() already copies ASCII-only strings straight through; base64 output is pure ASCII
+    return base64.urlsafe_b64encode(diagram.encode()).decode("ascii")
 
 
 def get_color_palette(name: str = "default") -> list[str]:
-    return COLOR_PALETTES.get(name, COLOR_PALETTES["default"])
+    return COLOR_PALETTES.get(name, _DEFAULT_PALETTE)
+
+
+def get_border_palette(name: str = "default") -> list[str]:
+    return BORDER_PALETTES.get(name, _DEFAULT_BORDER_PALETTE)
 
 
 def get_chart_theme(name: str = "light") -> dict:
-    return CHART_THEMES.get(name, CHART_THEMES["light"])
+    return CHART_THEMES.get(name, _DEFAULT_CHART_THEME)
+
+
+def get_chart_options(name: str = "light", has_scales: bool = True) -> dict:
+    return CHART_OPTIONS.get((name, has_scales)) or CHART_OPTIONS[("light", has_scales)]
 
 
 def get_table_style(name: str = "default") -> dict:
-    return TABLE_STYLES.get(name, TABLE_STYLES["default"])
+    return TABLE_STYLES.get(name, _DEFAULT_TABLE_STYLE)
+
+
+def min_chart_url_length(labels: list[str], datasets: list[dict]) -> int:
+    # Lower bound on the serialized URL: every label costs its text plus quotes and a
+    # comma, every data point at least one character plus a comma. Quoting only grows it.
+    label_chars = sum(len(label) + 3 for label in labels)
+    data_chars = sum(
+        2 * len(data) for data in (ds.get("data") for ds in datasets) if isinstance(data, (list, tuple))
+    )
+    return len(Config.QUICKCHART_URL) + label_chars + data_chars
 
 
 @mcp.tool()
@@ -79,7 +214,8 @@ async def draw_logic_flow(
     diagram_code: str,
     diagram_type: Literal["flowchart", "sequence", "state", "er", "gantt"] = "flowchart",
     theme: Literal["default", "dark", "forest", "neutral"] = "default",
-    title: Optional[str] = None
+    title: Optional[str] = None,
+    verify: bool = False
 ) -> dict:
     """
     프로세스, 코드 로직, 의사결정 흐름을 다이어그램으로 시각화합니다.
@@ -92,22 +228,25 @@ async def draw_logic_flow(
         diagram_type: Type of diagram (flowchart, sequence, state, er, gantt)
         theme: Visual theme (default, dark, forest, neutral)
         title: Optional title for the diagram
+        verify: Check that the image and editor URLs are reachable (adds a network round-trip)
     
     Returns:
-        Dictionary with image_url and edit_url for the diagram
+        Dictionary with image_url and edit_url for the diagram.
+        accessible and edit_accessible are None unless verify is True.
     """
-    themed_code = f"%%{{init: {{'theme': '{theme}'}}}}%%\n{diagram_code}"
+    themed_code = f"{MERMAID_THEME_HEADERS[theme]}\n{diagram_code}"
     encoded = encode_mermaid(themed_code)
     
     image_url = f"{Config.MERMAID_BASE_URL}/img/{encoded}"
     edit_url = f"{Config.MERMAID_LIVE_URL}/edit#base64:{encoded}"
     
-    async with httpx.AsyncClient(timeout=Config.HTTP_TIMEOUT) as client:
-        try:
-            response = await client.head(image_url)
-            accessible = response.status_code == 200
-        except Exception:
-            accessible = False
+    accessible = edit_accessible = None
+    if verify:
+        # The fragment never reaches the server, so probe the bare editor page
+        accessible, edit_accessible = await asyncio.gather(
+            _probe_url(image_url),
+            _probe_url(f"{Config.MERMAID_LIVE_URL}/edit"),
+        )
     
     return {
         "success": True,
@@ -117,10 +256,61 @@ async def draw_logic_flow(
         "image_url": image_url,
         "edit_url": edit_url,
         "accessible": accessible,
+        "edit_accessible": edit_accessible,
         "theme": theme
     }
 
 
+# serialized plot_data_chart arguments -> chart_url
+_chart_cache: dict[bytes, str] = {}
+
+
+def build_chart_url(
+    chart_type: str,
+    labels: list[str],
+    datasets: list[dict],
+    title: Optional[str],
+    theme: str,
+    color_palette: str,
+    width: int,
+    height: int
+) -> str:
+    theme_config = get_chart_theme(theme)
+    colors = get_color_palette(color_palette)
+    borders = get_border_palette(color_palette)
+    
+    # Fill colors into copies so the caller's datasets are never modified
+    datasets = [dict(ds) for ds in datasets]
+    for i, ds in enumerate(datasets):
+        if "backgroundColor" not in ds:
+            ds["backgroundColor"] = colors[i % len(colors)]
+            ds.setdefault("borderColor", borders[i % len(borders)])
+        elif "borderColor" not in ds:
+            ds["borderColor"] = ds["backgroundColor"].replace("0.7", "1").replace("0.8", "1")
+    
+    options = get_chart_options(theme, chart_type not in NO_SCALE_CHART_TYPES)
+    if title:
+        options = {**options, "plugins": {**options["plugins"], "title": {
+            "display": True, "text": title, "color": theme_config["font"], "font": {"size": 16}
+        }}}
+    
+    chart_config = {
+        "type": chart_type,
+        "data": {"labels": labels, "datasets": datasets},
+        "options": options
+    }
+    
+    try:
+        chart_json = orjson.dumps(chart_config).decode()
+    except orjson.JSONEncodeError:
+        # orjson rejects integers beyond 64 bits, which the stdlib encoder handles
+        chart_json = json.dumps(chart_config, separators=(",", ":"), ensure_ascii=False)
+    return (
+        f"{Config.QUICKCHART_URL}?c={quote(chart_json, safe='')}"
+        f"&w={width}&h={height}&bkg={QUOTED_BACKGROUNDS[theme_config['background']]}"
+    )
+
+
 @mcp.tool()
 async def plot_data_chart(
     chart_type: Literal["bar", "line", "pie", "doughnut", "radar", "scatter", "horizontalBar"],
@@ -152,40 +342,23 @@ async def plot_data_chart(
     Returns:
         Dictionary with image_url for the chart
     """
-    theme_config = get_chart_theme(theme)
-    colors = get_color_palette(color_palette)
-    
-    for i, ds in enumerate(datasets):
-        if "backgroundColor" not in ds:
-            ds["backgroundColor"] = colors[i % len(colors)]
-        if "borderColor" not in ds:
-            ds["borderColor"] = ds["backgroundColor"].replace("0.7", "1").replace("0.8", "1")
-    
-    chart_config = {
-        "type": chart_type,
-        "data": {"labels": labels, "datasets": datasets},
-        "options": {
-            "responsive": False,
-            "plugins": {"legend": {"labels": {"color": theme_config["font"]}}},
-            "scales": {} if chart_type in ["pie", "doughnut", "radar"] else {
-                "x": {"ticks": {"color": theme_config["font"]}, "grid": {"color": theme_config["grid"]}},
-                "y": {"ticks": {"color": theme_config["font"]}, "grid": {"color": theme_config["grid"]}}
-            }
-        }
-    }
-    
-    if title:
-        chart_config["options"]["plugins"]["title"] = {
-            "display": True, "text": title, "color": theme_config["font"], "font": {"size": 16}
-        }
-    
-    chart_json = json.dumps(chart_config)
-    params = {"c": chart_json, "w": width, "h": height, "bkg": theme_config["background"]}
-    chart_url = f"{Config.QUICKCHART_URL}?{urllib.parse.urlencode(params)}"
-    
-    if len(chart_url) > Config.QUICKCHART_MAX_URL_LENGTH:
+    if min_chart_url_length(labels, datasets) > Config.QUICKCHART_MAX_URL_LENGTH:
         return {"success": False, "error": "Chart data too large. Reduce data points."}
     
+    # Serialized inputs make a cheap exact key: same arguments, same chart URL.
+    # Inputs orjson cannot encode (e.g. integers beyond 64 bits) bypass the cache.
+    try:
+        cache_key = orjson.dumps([chart_type, labels, datasets, title, theme, color_palette, width, height])
+    except orjson.JSONEncodeError:
+        cache_key = None
+    chart_url = _chart_cache.get(cache_key) if cache_key is not None else None
+    if chart_url is None:
+        chart_url = build_chart_url(chart_type, labels, datasets, title, theme, color_palette, width, height)
+        if len(chart_url) > Config.QUICKCHART_MAX_URL_LENGTH:
+            return {"success": False, "error": "Chart data too large. Reduce data points."}
+        if cache_key is not None:
+            cache_put(_chart_cache, cache_key, chart_url, Config.CHART_CACHE_SIZE)
+    
     return {
         "success": True,
         "type": "chart",
@@ -220,20 +393,13 @@ async def render_mindmap(
     Returns:
         Dictionary with image_url and edit_url for the mindmap
     """
-    lines = [
-        f"%%{{init: {{'theme': '{theme}'}}}}%%",
-        "mindmap",
-        f"  root(({central_topic}))"
-    ]
+    header = [MERMAID_THEME_HEADERS[theme], "mindmap", f"  root(({central_topic}))"]
+    body = itertools.chain.from_iterable(
+        itertools.chain((f"    {branch.get('name', '')}",), (f"      {child}" for child in branch.get("children", [])))
+        for branch in branches
+    )
     
-    for branch in branches:
-        branch_name = branch.get("name", "")
-        children = branch.get("children", [])
-        lines.append(f"    {branch_name}")
-        for child in children:
-            lines.append(f"      {child}")
-    
-    diagram_code = "\n".join(lines)
+    diagram_code = "\n".join(itertools.chain(header, body))
     encoded = encode_mermaid(diagram_code)
     
     image_url = f"{Config.MERMAID_BASE_URL}/img/{encoded}"
@@ -281,44 +447,50 @@ async def generate_table(
         return {"success": False, "error": "Headers and rows cannot be empty."}
     
     col_count = len(headers)
-    for i, row in enumerate(rows):
-        if len(row) != col_count:
-            return {"success": False, "error": f"Row {i+1} column count mismatch."}
+    mismatch = next((i for i, row in enumerate(rows) if len(row) != col_count), None)
+    if mismatch is not None:
+        return {"success": False, "error": f"Row {mismatch+1} column count mismatch."}
     
     table_style = get_table_style(style)
     
     if format == "markdown":
-        lines = []
-        if title:
-            lines.append(f"### {title}\n")
-        lines.append("| " + " | ".join(headers) + " |")
-        separators = [":---:" if highlight_column == i else "---" for i in range(col_count)]
-        lines.append("| " + " | ".join(separators) + " |")
-        for row in rows:
-            if highlight_column is not None:
-                row = [f"**{cell}**" if i == highlight_column else cell for i, cell in enumerate(row)]
-            lines.append("| " + " | ".join(row) + " |")
-        table_string = "\n".join(lines)
+        separator = "| " + " | ".join(":---:" if highlight_column == i else "---" for i in range(col_count)) + " |"
+        if highlight_column is None:
+            body = ("| " + " | ".join(row) + " |" for row in rows)
+        else:
+            body = (
+                "| " + " | ".join(f"**{cell}**" if i == highlight_column else cell for i, cell in enumerate(row)) + " |"
+                for row in rows
+            )
+        table_string = "\n".join(itertools.chain(
+            [f"### {title}\n"] if title else [],
+            ["| " + " | ".join(headers) + " |", separator],
+            body,
+        ))
     else:
         s = table_style
-        lines = []
-        if title:
-            lines.append(f"<h3>{title}</h3>")
-        lines.append('<table style="border-collapse: collapse; width: 100%;">')
-        lines.append("  <thead><tr>")
-        for i, h in enumerate(headers):
-            bg = s["highlight_bg"] if highlight_column == i else s["header_bg"]
-            lines.append(f'    <th style="border: 1px solid {s["border"]}; padding: 8px; background-color: {bg}; color: {s["header_color"]};">{h}</th>')
-        lines.append("  </tr></thead><tbody>")
-        for row in rows:
-            lines.append("    <tr>")
-            for i, cell in enumerate(row):
-                bg = s["highlight_bg"] if highlight_column == i else "transparent"
-                weight = "bold" if highlight_column == i else "normal"
-                lines.append(f'      <td style="border: 1px solid {s["border"]}; padding: 8px; background-color: {bg}; font-weight: {weight};">{cell}</td>')
-            lines.append("    </tr>")
-        lines.append("  </tbody></table>")
-        table_string = "\n".join(lines)
+        cell_border = f'border: 1px solid {s["border"]}; padding: 8px;'
+        th = f'    <th style="{cell_border} background-color: {s["header_bg"]}; color: {s["header_color"]};">'
+        th_hi = f'    <th style="{cell_border} background-color: {s["highlight_bg"]}; color: {s["header_color"]};">'
+        td = f'      <td style="{cell_border} background-color: transparent; font-weight: normal;">'
+        td_hi = f'      <td style="{cell_border} background-color: {s["highlight_bg"]}; font-weight: bold;">'
+        th_tags = [th_hi if i == highlight_column else th for i in range(col_count)]
+        td_tags = [td_hi if i == highlight_column else td for i in range(col_count)]
+        
+        header_html = "\n".join(f"{tag}{h}</th>" for tag, h in zip(th_tags, headers))
+        body_html = "\n".join(
+            "    <tr>\n" + "\n".join(f"{tag}{cell}</td>" for tag, cell in zip(td_tags, row)) + "\n    </tr>"
+            for row in rows
+        )
+        table_string = "\n".join([
+            *([f"<h3>{title}</h3>"] if title else []),
+            '<table style="border-collapse: collapse; width: 100%;">',
+            "  <thead><tr>",
+            header_html,
+            "  </tr></thead><tbody>",
+            body_html,
+            "  </tbody></table>",
+        ])
     
     return {
         "success": True,
@@ -330,6 +502,29 @@ async def generate_table(
     }
 
 
+def sse_app():
+    app = mcp.sse_app()
+    inner_lifespan = app.router.lifespan_context
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        async with inner_lifespan(app) as state:
+            try:
+                yield state
+            finally:
+                await close_http_client()
+    
+    app.router.lifespan_context = lifespan
+    return app
+
+
+async def run_stdio() -> None:
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        await close_http_client()
+
+
 if __name__ == "__main__":
     import sys
     
@@ -338,7 +533,7 @@ if __name__ == "__main__":
         # Remote deployment (Render) - use SSE
         import uvicorn
         port = int(os.environ.get("PORT", 8000))
-        uvicorn.run(mcp.sse_app(), host="0.0.0.0", port=port)
+        uvicorn.run(sse_app(), host="0.0.0.0", port=port, loop="uvloop", http="httptools")
     else:
         # Local (Claude Desktop) - use stdio
-        mcp.run(transport="stdio")
\ No newline at end of file
+        asyncio.run(run_stdio())
\ No newline at end of file